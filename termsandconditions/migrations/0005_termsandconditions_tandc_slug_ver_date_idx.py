@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-08-26 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('termsandconditions', '0004_auto_20201107_0711'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='termsandconditions',
+            index=models.Index(fields=['slug', 'version_number', '-date_active'], name='tandc_slug_ver_date_idx'),
+        ),
+    ]
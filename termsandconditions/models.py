@@ -91,6 +91,12 @@ class TermsAndConditions(models.Model):
         ordering = [
             "-date_active",
         ]
+        indexes = [
+            models.Index(
+                fields=["slug", "version_number", "-date_active"],
+                name="tandc_slug_ver_date_idx",
+            ),
+        ]
         get_latest_by = "date_active"
         verbose_name = _("Terms and Conditions")
         verbose_name_plural = _("Terms and Conditions")
@@ -181,24 +187,31 @@ class TermsAndConditions(models.Model):
         if TERMS_EXCLUDE_SUPERUSERS and user.is_superuser:
             return []
 
-        not_agreed_terms = cache.get("tandc.not_agreed_terms_" + user.get_username())
-        if not_agreed_terms is None:
+        # The per-user cache holds only the ids - a handful of ints pickle far
+        # cheaper than full model instances, which are rebuilt from the shared
+        # active-terms cache on read
+        not_agreed_ids = cache.get("tandc.not_agreed_terms_" + user.get_username())
+        if not_agreed_ids is None:
             try:
                 LOGGER.debug("Not Agreed Terms")
-                not_agreed_terms = (
+                not_agreed_ids = list(
                     TermsAndConditions.get_active_terms_list()
-                    .exclude(
-                        userterms__in=UserTermsAndConditions.objects.filter(user=user)
-                    )
+                    .exclude(userterms__user=user)
                     .order_by("slug")
+                    .values_list("id", flat=True)
                 )
 
                 cache.set(
                     "tandc.not_agreed_terms_" + user.get_username(),
-                    not_agreed_terms,
+                    not_agreed_ids,
                     TERMS_CACHE_SECONDS,
                 )
             except (TypeError, UserTermsAndConditions.DoesNotExist):
                 return []
 
-        return not_agreed_terms
+        not_agreed_ids = set(not_agreed_ids)
+        return [
+            terms
+            for terms in TermsAndConditions.get_active_terms_list()
+            if terms.id in not_agreed_ids
+        ]
@@ -23,9 +23,16 @@ def user_terms_updated(sender, **kwargs):
 def terms_updated(sender, **kwargs):
     """Called when terms and conditions is changed - to force cache clearing"""
     LOGGER.debug("T&C Updated Signal Handler")
+    instance = kwargs.get("instance")
     cache.delete("tandc.active_terms_ids")
     cache.delete("tandc.active_terms_list")
-    if kwargs.get("instance").slug:
-        cache.delete("tandc.active_terms_" + kwargs.get("instance").slug)
+    cache.delete("tandc.active_terms_evaluated")
+    cache.delete(f"tandc.email_body_{instance.pk}_{instance.version_number}")
+    # Bump the version token so template fragment caches keyed on it miss;
+    # add() + incr() keeps the bump atomic under concurrent saves
+    cache.add("tandc.active_terms_version", 0, None)
+    cache.incr("tandc.active_terms_version")
+    if instance.slug:
+        cache.delete("tandc.active_terms_" + instance.slug)
     for utandc in UserTermsAndConditions.objects.all():
         cache.delete("tandc.not_agreed_terms_" + utandc.user.get_username())
@@ -14,6 +14,7 @@ from django.template import Context, Template
 from .models import TermsAndConditions, UserTermsAndConditions, DEFAULT_TERMS_SLUG
 from .pipeline import user_accept_terms
 from .templatetags.terms_tags import show_terms_if_not_agreed
+from .views import AcceptTermsView
 
 LOGGER = logging.getLogger(name="termsandconditions")
 
@@ -310,6 +311,20 @@ class TermsAndConditionsTests(TestCase):
             user_terms = UserTermsAndConditions.objects.all()[0]
             self.assertFalse(user_terms.ip_address)
 
+    def test_accept_missing_ip_header(self):
+        """Test accepting still works when the IP header is absent entirely"""
+        request = RequestFactory().post(
+            "/terms/accept/", {"terms": 2, "returnTo": "/secure/"}
+        )
+        del request.META["REMOTE_ADDR"]
+        request.user = self.user1
+        accept_response = AcceptTermsView.as_view()(request)
+        self.assertEqual(accept_response.status_code, 302)
+        user_terms = UserTermsAndConditions.objects.all()[0]
+        self.assertEqual(user_terms.user, self.user1)
+        self.assertEqual(user_terms.terms, self.terms2)
+        self.assertFalse(user_terms.ip_address)
+
     def test_terms_upgrade(self):
         """Validate a user is prompted to accept terms again when new version comes out"""
 
@@ -384,6 +399,15 @@ class TermsAndConditionsTests(TestCase):
         self.assertContains(version_response, self.terms3.name)
         self.assertContains(version_response, self.terms3.text)
 
+    def test_terms_view_unknown_version(self):
+        """Test viewing a slug/version combination that does not exist renders an empty list"""
+        LOGGER.debug("Test /terms/view/site-terms/9.9 with anon")
+        unknown_version_response = self.client.get(
+            "/terms/view/site-terms/9.9/", follow=True
+        )
+        self.assertEqual(unknown_version_response.status_code, 200)
+        self.assertContains(unknown_version_response, "No terms for you to accept.")
+
     def test_user_terms_view(self):
         """Test Accessing the View Terms and Conditions Page for Logged In User"""
         login_response = self.client.login(username="user1", password="user1password")
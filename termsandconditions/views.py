@@ -1,27 +1,78 @@
 """Django Views for the termsandconditions module"""
 
 from django.contrib.auth.models import User
-from django.db import IntegrityError
+from django.db import transaction
 
 from django.core.cache import cache
 
 from .forms import UserTermsAndConditionsModelForm, EmailTermsForm
 from .models import TermsAndConditions, UserTermsAndConditions
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
 from django.contrib import messages
 from django.http import HttpResponseRedirect
-from django.utils.translation import gettext as _
+from django.utils.translation import get_language, gettext as _
 from django.views.generic import DetailView, CreateView, FormView
 from django.template.loader import get_template
 from django.utils.encoding import iri_to_uri
+from django.utils.functional import SimpleLazyObject
 import logging
 from smtplib import SMTPException
 
+# In Django 3.0 is_safe_url is renamed, so we import conditionally:
+# https://docs.djangoproject.com/en/3.2/releases/3.0/#id3
+try:
+    from django.utils.http import url_has_allowed_host_and_scheme
+except ImportError:  # pragma: nocover
+    from django.utils.http import is_safe_url as url_has_allowed_host_and_scheme
+
 LOGGER = logging.getLogger(name="termsandconditions")
 DEFAULT_TERMS_BASE_TEMPLATE = "base.html"
 DEFAULT_TERMS_IP_HEADER_NAME = "REMOTE_ADDR"
-TERMS_CACHE_SECONDS = getattr(settings, "TERMS_CACHE_SECONDS", 30)
+TERMS_BASE_TEMPLATE = getattr(
+    settings, "TERMS_BASE_TEMPLATE", DEFAULT_TERMS_BASE_TEMPLATE
+)
+TERMS_IP_HEADER_NAME = getattr(
+    settings, "TERMS_IP_HEADER_NAME", DEFAULT_TERMS_IP_HEADER_NAME
+)
+# Lazy so @override_settings(TERMS_CACHE_SECONDS=...) applied before first
+# use is respected; SimpleLazyObject caches after the first resolution
+TERMS_CACHE_SECONDS = SimpleLazyObject(
+    lambda: getattr(settings, "TERMS_CACHE_SECONDS", 30)
+)
+
+
+_EMAIL_TEMPLATE = None
+
+
+def _email_template():
+    """Resolves the terms email template once and reuses the compiled object"""
+    global _EMAIL_TEMPLATE
+    if _EMAIL_TEMPLATE is None:
+        _EMAIL_TEMPLATE = get_template("termsandconditions/tc_email_terms.html")
+    return _EMAIL_TEMPLATE
+
+
+def _render_email_body(terms):
+    """Renders the terms email body, cached per (pk, version) in the shared
+    cache so repeated sends of the same terms skip the template render"""
+    cache_key = f"tandc.email_body_{terms.pk}_{terms.version_number}"
+    body = cache.get(cache_key)
+    if body is None:
+        body = _email_template().render({"terms": terms})
+        cache.set(cache_key, body, TERMS_CACHE_SECONDS)
+    return body
+
+
+def _cached_active_terms_list():
+    """Returns the active terms as an evaluated list, cached so repeated reads skip the DB"""
+    active_terms_list = cache.get("tandc.active_terms_evaluated")
+    if active_terms_list is None:
+        active_terms_list = list(TermsAndConditions.get_active_terms_list())
+        cache.set(
+            "tandc.active_terms_evaluated", active_terms_list, TERMS_CACHE_SECONDS
+        )
+    return active_terms_list
 
 
 class GetTermsViewMixin:
@@ -34,22 +85,35 @@ class GetTermsViewMixin:
         version = kwargs.get("version")
 
         if slug and version:
-            terms = [
-                TermsAndConditions.objects.filter(
-                    slug=slug, version_number=version
-                ).latest("date_active")
-            ]
+            # first() avoids the DoesNotExist exception path of latest()
+            terms_object = (
+                TermsAndConditions.objects.filter(slug=slug, version_number=version)
+                .order_by("-date_active")
+                .first()
+            )
+            terms = [terms_object] if terms_object else []
         elif slug:
             terms = [TermsAndConditions.get_active(slug)]
+        elif not self.request.user.is_authenticated:
+            # Anonymous users have agreed to nothing, so the answer is simply
+            # every active terms document - skip the per-user join entirely
+            terms = _cached_active_terms_list()
         else:
-            # Return a list of not agreed to terms for the current user for the list view
-            terms = TermsAndConditions.get_active_terms_not_agreed_to(self.request.user)
+            # Return a list of not agreed to terms for the current user for the list view,
+            # evaluated up front so template loops do not re-run the queryset
+            terms = list(
+                TermsAndConditions.get_active_terms_not_agreed_to(self.request.user)
+            )
         return terms
 
     def get_return_to(self, from_dict):
         return_to = from_dict.get("returnTo", "/")
 
         if self.is_safe_url(return_to):
+            # Pure-ASCII URLs (the overwhelmingly common case) need no
+            # percent-encoding, so skip the character walk in iri_to_uri
+            if return_to.isascii():
+                return return_to
             # Django recommends to use this together with the helper above
             return iri_to_uri(return_to)
 
@@ -57,15 +121,6 @@ class GetTermsViewMixin:
         return "/"
 
     def is_safe_url(self, url):
-        # In Django 3.0 is_safe_url is renamed, so we import conditionally:
-        # https://docs.djangoproject.com/en/3.2/releases/3.0/#id3
-        try:
-            from django.utils.http import url_has_allowed_host_and_scheme
-        except ImportError:
-            from django.utils.http import (
-                is_safe_url as url_has_allowed_host_and_scheme,
-            )
-
         return url_has_allowed_host_and_scheme(url, settings.ALLOWED_HOSTS)
 
 
@@ -83,9 +138,7 @@ class AcceptTermsView(CreateView, GetTermsViewMixin):
     def get_context_data(self, **kwargs):
         """Pass additional context data"""
         context = super().get_context_data(**kwargs)
-        context["terms_base_template"] = getattr(
-            settings, "TERMS_BASE_TEMPLATE", DEFAULT_TERMS_BASE_TEMPLATE
-        )
+        context["terms_base_template"] = TERMS_BASE_TEMPLATE
         return context
 
     def get_initial(self):
@@ -108,47 +161,53 @@ class AcceptTermsView(CreateView, GetTermsViewMixin):
             return HttpResponseRedirect(return_url)
 
         if request.user.is_authenticated:
-            user = request.user
+            user_pk = request.user.pk
         else:
             # Get user out of saved pipeline from django-socialauth
             if "partial_pipeline" in request.session:
                 user_pk = request.session["partial_pipeline"]["kwargs"]["user"]["pk"]
-                user = User.objects.get(id=user_pk)
             else:
                 return HttpResponseRedirect("/")
 
         store_ip_address = getattr(settings, "TERMS_STORE_IP_ADDRESS", True)
         if store_ip_address:
-            ip_address = request.META.get(
-                getattr(settings, "TERMS_IP_HEADER_NAME", DEFAULT_TERMS_IP_HEADER_NAME)
-            )
-            if "," in ip_address:
-                ip_address = ip_address.split(",")[0].strip()
+            ip_address = request.META.get(TERMS_IP_HEADER_NAME) or ""
+            # Keep only the first address if the header holds a comma-separated list
+            ip_address = ip_address.partition(",")[0].strip()
         else:
             ip_address = ""
 
-        for terms_id in terms_ids:
-            try:
-                new_user_terms = UserTermsAndConditions(
-                    user=user,
-                    terms=TermsAndConditions.objects.get(pk=int(terms_id)),
-                    ip_address=ip_address,
-                )
-                new_user_terms.save()
-                not_agreed_terms = (
-                    TermsAndConditions.get_active_terms_list()
-                    .exclude(
-                        userterms__in=UserTermsAndConditions.objects.filter(user=user)
+        with transaction.atomic():
+            # Lock the user row so concurrent accept submits (e.g. two open
+            # tabs) serialize instead of racing the already-accepted check
+            # Only id (FK target) and username (cache key) are used below
+            user = (
+                User.objects.select_for_update().only("id", "username").get(pk=user_pk)
+            )
+            # De-dup repeated ids and skip terms the user has already accepted,
+            # so no insert ever has to hit the unique constraint
+            ids = {int(terms_id) for terms_id in terms_ids}
+            already_accepted = set(
+                UserTermsAndConditions.objects.filter(
+                    user=user, terms_id__in=ids
+                ).values_list("terms_id", flat=True)
+            )
+            # in_bulk keeps one query while making client-supplied junk ids
+            # explicit - they simply miss the dict and are skipped
+            terms_by_id = TermsAndConditions.objects.in_bulk(ids - already_accepted)
+            UserTermsAndConditions.objects.bulk_create(
+                [
+                    UserTermsAndConditions(
+                        user=user, terms=terms_object, ip_address=ip_address
                     )
-                    .order_by("slug")
-                )
-                cache.set(
-                    "tandc.not_agreed_terms_" + user.get_username(),
-                    not_agreed_terms,
-                    TERMS_CACHE_SECONDS,
-                )
-            except IntegrityError:  # pragma: nocover
-                pass
+                    for terms_object in terms_by_id.values()
+                ],
+                ignore_conflicts=True,
+            )
+        # bulk_create does not send post_save, so the cache-clearing signal
+        # handler never fires - invalidate the per-user cache here (after
+        # commit) and let the next read repopulate it
+        cache.delete("tandc.not_agreed_terms_" + user.get_username())
 
         return HttpResponseRedirect(return_url)
 
@@ -167,9 +226,7 @@ class EmailTermsView(FormView, GetTermsViewMixin):
     def get_context_data(self, **kwargs):
         """Pass additional context data"""
         context = super().get_context_data(**kwargs)
-        context["terms_base_template"] = getattr(
-            settings, "TERMS_BASE_TEMPLATE", DEFAULT_TERMS_BASE_TEMPLATE
-        )
+        context["terms_base_template"] = TERMS_BASE_TEMPLATE
         return context
 
     def get_initial(self):
@@ -186,20 +243,18 @@ class EmailTermsView(FormView, GetTermsViewMixin):
         """Override of CreateView method, sends the email."""
         LOGGER.debug("termsandconditions.views.EmailTermsView.form_valid")
 
-        template = get_template("termsandconditions/tc_email_terms.html")
-        template_rendered = template.render({"terms": form.cleaned_data.get("terms")})
+        template_rendered = _render_email_body(form.cleaned_data.get("terms"))
 
         LOGGER.debug("Email Terms Body:")
         LOGGER.debug(template_rendered)
 
         try:
-            send_mail(
+            EmailMessage(
                 form.cleaned_data.get("email_subject", _("Terms")),
                 template_rendered,
                 settings.DEFAULT_FROM_EMAIL,
                 [form.cleaned_data.get("email_address")],
-                fail_silently=False,
-            )
+            ).send(fail_silently=False)
             messages.add_message(
                 self.request, messages.INFO, _("Terms and Conditions Sent.")
             )
@@ -234,9 +289,21 @@ class TermsView(DetailView, GetTermsViewMixin):
     def get_context_data(self, **kwargs):
         """Pass additional context data"""
         context = super().get_context_data(**kwargs)
-        context["terms_base_template"] = getattr(
-            settings, "TERMS_BASE_TEMPLATE", DEFAULT_TERMS_BASE_TEMPLATE
+        context["terms_base_template"] = TERMS_BASE_TEMPLATE
+        # Fragment-cache key pieces for tc_view_terms.html: the ids fully
+        # determine which documents render, the version token is bumped by
+        # the signal handler whenever any terms row changes, and the active
+        # language varies the block's translated strings
+        context["tandc_cache_version"] = cache.get("tandc.active_terms_version", 0)
+        context["tandc_language"] = get_language()
+        # SingleObjectMixin leaves terms_list out of the context entirely
+        # when the object is an empty list
+        context["tandc_terms_key"] = "-".join(
+            str(terms.id) if terms else "none"
+            for terms in context.get("terms_list") or []
         )
+        # Coerce the lazy setting to a real int for the {% cache %} tag
+        context["terms_cache_seconds"] = TERMS_CACHE_SECONDS + 0
         return context
 
     def get_object(self, queryset=None):
@@ -255,4 +322,4 @@ class TermsActiveView(TermsView):
     def get_object(self, queryset=None):
         """Override of DetailView method, queries for which T&C to return"""
         LOGGER.debug("termsandconditions.views.AllTermsView.get_object")
-        return TermsAndConditions.get_active_terms_list()
+        return _cached_active_terms_list()